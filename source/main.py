@@ -1,9 +1,8 @@
 #Including libraries
-import numpy as np
 import os
 import logging
 from start import read_config_file
-from psf_functions import gaussian_psf, laguerre_gaussian_donut, effective_psf
+from psf_functions import build_psfs, cp
 from resolution_functions import fwhm, diffraction_limit
 from visual import plot_results
 #-----------------------------------------------------------------------------
@@ -42,6 +41,7 @@ Description of parameters:
     - I0_sted: STED beam peak intensity (normalized) (0–100)
     - grid_size: Simulation grid resolution (256–1000)
     - extent_nm: Physical extent of the field in nm (500–2000)
+    - use_gpu: Compute the PSFs on the GPU with CuPy (true/false)
 """
 params = read_config_file()  #Reads the config.txt and returns parameters
 
@@ -58,16 +58,12 @@ else:
     I0_sted = params["I0_sted"]
     grid_size = params["grid_size"]
     extent_nm = params["extent_nm"]
+    use_gpu = params["use_gpu"]
     
     # ------------------------------------------------------------------------
     # GRID and POINT SPREAD FUNCTION (PSF) CONSTRUCTION
     # ------------------------------------------------------------------------
     
-    # Set up the grid
-    xy = np.linspace(-extent_nm/2, extent_nm/2, grid_size)
-    x, y = np.meshgrid(xy, xy)
-    r2 = x**2 + y**2
-
     # Calculate BEAM WAISTS Based on Wavelengths
     w_exc = diffraction_limit(lambda_exc, NA)  # Excitation beam waist (nm)
     w_sted = diffraction_limit(lambda_sted, NA)  # STED beam waist (nm)
@@ -75,15 +71,15 @@ else:
     logger.info(f"Excitation Beam Waist (w0) = {w_exc:.2f} nm")
     logger.info(f"STED Beam Waist (w0) = {w_sted:.2f} nm")
 
-    # Generate PSFs
-    exc_psf = gaussian_psf(x, y, w_exc)
-    sted_donut = laguerre_gaussian_donut(x, y, w_sted)
-    eff_psf = effective_psf(exc_psf, sted_donut, I_s, I0_sted)
+    if use_gpu and cp is None:
+        logger.warning("use_gpu is set but CuPy is not installed, using the CPU")
 
-    # Normalize for plotting
-    exc_psf /= exc_psf.max()
-    sted_donut /= sted_donut.max()
-    eff_psf /= eff_psf.max()
+    # Generate PSFs. All three peak at 1 
+    # analytically, so they are used as they are for both the FWHM and the 
+    # plots, without any normalization pass
+    exc_psf, sted_donut, eff_psf = build_psfs(lambda_exc, lambda_sted, NA, 
+                                              I_s, I0_sted, grid_size, 
+                                              extent_nm, use_gpu)
 
     # ------------------------------------------------------------------------
     # DATA ANALYSIS
@@ -92,9 +88,11 @@ else:
     # Calculate Abbe diffraction limit
     abbe_resolution = diffraction_limit(lambda_exc, NA)
     
-    # Calculate the Full Width at Half Maximum (FWHM) for Comparison
-    fwhm_exc = fwhm(exc_psf)  # FWHM of excitation PSF
-    fwhm_eff = fwhm(eff_psf)  # FWHM of effective PSF (after STED)
+    # Calculate the Full Width at Half Maximum (FWHM) for Comparison 
+    # (threshold is relative to the peak, so independent of scaling)
+    pixel_size = extent_nm / (grid_size - 1)  # Grid spacing (nm)
+    fwhm_exc = fwhm(exc_psf, pixel_size)  # FWHM of excitation PSF (nm)
+    fwhm_eff = fwhm(eff_psf, pixel_size)  # FWHM of effective PSF (nm)
         
     logger.info(f"Abbe Diffraction Limit: {abbe_resolution:.2f} nm")
     logger.info(f"Excitation Beam FWHM: {fwhm_exc:.2f} nm")
@@ -1,39 +1,99 @@
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
+from resolution_functions import diffraction_limit
 
-def gaussian_psf(x, y, w0):
+try:
+    from numba import njit, prange
+    HAVE_NUMBA = True
+except ImportError:
+    # Without Numba the fused kernel stays plain Python and build_psfs() 
+    # falls back to compute_all_psfs_numpy()
+    HAVE_NUMBA = False
+    prange = range
+    def njit(*args, **kwargs):
+        return lambda func: func
+
+try:
+    # Fuses the element-wise N x N expressions of the NumPy path into 
+    # blocked, multi-threaded loops without full-size temporaries
+    import numexpr as ne
+except ImportError:
+    ne = None
+
+try:
+    # GPU backend for build_psfs(..., use_gpu=True)
+    import cupy as cp
+except ImportError:
+    cp = None
+
+# Cache budget used to size the row tiles of compute_all_psfs(), so that one 
+# tile of all three PSFs stays resident in a typical per-core L2 cache
+L2_CACHE_BYTES = 256 * 1024
+
+# Smallest grid_size for which the NumPy fallback evaluates the excitation 
+# and STED PSFs in parallel threads (smaller grids are not worth the overhead)
+PARALLEL_MIN_GRID = 512
+
+def gaussian_psf(x2, w0):
     """
     Function that generates a 2D Gaussian point spread function (PSF).
 
+    The Gaussian is separable, exp(-(x^2+y^2)/w0^2) = exp(-x^2/w0^2) *
+    exp(-y^2/w0^2), so it is evaluated once along one axis (N exponentials) 
+    and expanded to 2D with an outer product instead of N^2 exponentials.
+
+    The peak is exactly 1 at r = 0 (on the grid when grid_size is odd, 
+    within a fraction of a pixel otherwise), so it needs no normalization.
+
     Input parameters:
-        x, y : 2D NumPy arrays
-            Meshgrid coordinate arrays representing spatial coordinates (nm).
+        x2 : 1D NumPy array
+            Squared spatial coordinates along one axis (nm^2), shared by 
+            both axes (e.g. xy * xy).
         w0 : float
             Beam waist (radius at which the intensity drops by 1/e).
 
     Output:
         2D NumPy array representing intensity distribution of the Gaussian PSF.
     """
-    return np.exp(-(x**2 + y**2) / w0**2)
+    inv_w2 = 1.0 / (w0 * w0)  # Multiply instead of dividing every element
+    g = np.exp(-x2 * inv_w2)
+    return g[:, None] * g[None, :]
 
-def laguerre_gaussian_donut(x, y, w, m=1):
+def laguerre_gaussian_donut(x2, w, m=1):
     """
     Function that generates a 2D Laguerre-Gaussian donut-shaped PSF.
 
+    r^2 is broadcast from the 1D squared coordinates and the Gaussian 
+    envelope is evaluated separably, as in gaussian_psf().
+
+    The analytical peak is (m/e)^m, reached on the ring r^2 = m * w^2, so 
+    dividing by it normalizes the donut without scanning the array.
+
     Input parameters:
-        x, y : 2D NumPy arrays
-            Meshgrid coordinate arrays representing spatial coordinates (nm).
+        x2 : 1D NumPy array
+            Squared spatial coordinates along one axis (nm^2), shared by 
+            both axes (e.g. xy * xy).
         w : float
             Beam waist (radius at which the intensity drops by 1/e).
         m : int, optional
-            Azimuthal mode index (default is 1). 
+            Azimuthal mode index (default is 1).
             Higher values increase the size of the central dark region.
 
     Output:
-        2D NumPy array 
+        2D NumPy array
         Intensity distribution of the 2D Laguerre-Gaussian donut-shaped PSF.
     """
-    r2 = x**2 + y**2
-    return (r2 / w**2)**m * np.exp(-r2 / w**2)
+    inv_w2 = 1.0 / (w * w)  # Multiply instead of dividing every element
+    g = np.exp(-x2 * inv_w2)
+    if ne is not None:
+        # Scalars cast to the array precision so numexpr does not upcast
+        dtype = np.result_type(x2, np.float32).type
+        return ne.evaluate("((xx + yy) * inv_w2)**m * gx * gy", 
+                           local_dict={"xx": x2[:, None], "yy": x2[None, :], 
+                                       "gx": g[:, None], "gy": g[None, :], 
+                                       "inv_w2": dtype(inv_w2), "m": dtype(m)})
+    r2 = x2[:, None] + x2[None, :]
+    return (r2 * inv_w2)**m * (g[:, None] * g[None, :])
 
 def effective_psf(exc_psf, sted_psf, I_s, I0_sted):
     """
@@ -54,4 +114,201 @@ def effective_psf(exc_psf, sted_psf, I_s, I0_sted):
         2D NumPy array 
         Effective PSF after applying STED depletion.
     """    
-    return exc_psf * np.exp(-I0_sted * sted_psf / I_s)
+    k = -I0_sted / I_s  # Sign and division folded into one scalar
+    if ne is not None:
+        # Scalar cast to the array precision so numexpr does not upcast
+        k = exc_psf.dtype.type(k)
+        return ne.evaluate("e * exp(k * s)", 
+                           local_dict={"e": exc_psf, "s": sted_psf, "k": k})
+    return exc_psf * np.exp(k * sted_psf)
+
+@njit(parallel=True, fastmath=True, cache=True)
+def compute_all_psfs(x2, w_exc, w_sted, I_s, I0_sted):
+    """
+    Function that computes the excitation PSF, the STED donut and the 
+    effective PSF in a single fused pass over the grid.
+
+    Each pixel evaluates r^2 once and writes all three arrays, so no 
+    intermediate N x N temporaries are created. The Gaussian factors are 
+    separable and are precomputed once per axis, leaving a single 
+    exponential per pixel (for the effective PSF). Rows are processed in 
+    tiles sized to L2_CACHE_BYTES, one tile per parallel iteration.
+
+    The excitation PSF and the donut (m = 1) have analytical peaks of 1 and 
+    1/e, so they are normalized as they are written. The effective PSF needs 
+    no normalization either: the donut is zero at r = 0, so its peak is that 
+    of the excitation PSF, 1, whatever I_s and I0_sted are.
+
+    The compiled kernel is cached on disk (cache=True, in __pycache__), so 
+    only the first run pays the Numba compilation time; later runs load the 
+    machine code instead of recompiling it.
+
+    Input parameters:
+        x2 : 1D NumPy array
+            Squared spatial coordinates along one axis (nm^2), shared by 
+            both axes (e.g. xy * xy). Its dtype (float32 or float64) sets 
+            the precision of the computation and of the returned PSFs.
+        w_exc : float
+            Excitation beam waist (nm).
+        w_sted : float
+            STED beam waist (nm).
+        I_s : float
+            Saturation intensity (normalized).
+        I0_sted : float
+            Peak STED intensity (normalized).
+
+    Output:
+        Tuple of three 2D NumPy arrays (exc_psf, sted_donut, eff_psf), 
+        each normalized to a peak value of 1.
+    """
+    n = x2.shape[0]
+    exc_psf = np.empty((n, n), dtype=x2.dtype)
+    sted_donut = np.empty((n, n), dtype=x2.dtype)
+    eff_psf = np.empty((n, n), dtype=x2.dtype)
+
+    # Scalars hoisted out of the pixel loop, cast to the grid precision so 
+    # float32 grids are not promoted to float64 inside the loop
+    inv_w_exc2 = x2.dtype.type(1.0 / (w_exc * w_exc))
+    inv_w_sted2 = x2.dtype.type(1.0 / (w_sted * w_sted))
+    k = x2.dtype.type(-I0_sted / I_s)
+    inv_peak_d = x2.dtype.type(np.e)  # Donut peak is 1/e (m = 1)
+
+    # Separable 1D Gaussian factors (N exponentials per beam instead of N^2)
+    g_exc = np.exp(-x2 * inv_w_exc2)
+    s2 = x2 * inv_w_sted2
+    g_sted = np.exp(-s2)
+
+    # Rows per tile so that a tile of the three output arrays fits in L2
+    tile = max(1, L2_CACHE_BYTES // (3 * n * x2.itemsize))
+    n_tiles = (n + tile - 1) // tile
+
+    for t in prange(n_tiles):
+        for i in range(t * tile, min((t + 1) * tile, n)):
+            s2i = s2[i]
+            g_exc_i = g_exc[i]
+            g_sted_i = g_sted[i]
+            for j in range(n):
+                e = g_exc_i * g_exc[j]
+                d = (s2i + s2[j]) * (g_sted_i * g_sted[j])
+                exc_psf[i, j] = e
+                sted_donut[i, j] = d * inv_peak_d
+                eff_psf[i, j] = e * np.exp(k * d)
+    return exc_psf, sted_donut, eff_psf
+
+def compute_all_psfs_numpy(x2, w_exc, w_sted, I_s, I0_sted):
+    """
+    Function that computes the same normalized PSFs as compute_all_psfs() 
+    with NumPy only, for use when Numba is not available.
+
+    The excitation PSF and the STED donut are independent, so for grids of 
+    at least PARALLEL_MIN_GRID points they are evaluated in two threads 
+    (NumPy releases the GIL inside its array operations).
+
+    Input parameters:
+        Same as compute_all_psfs().
+
+    Output:
+        Tuple of three 2D NumPy arrays (exc_psf, sted_donut, eff_psf), 
+        each normalized to a peak value of 1.
+    """
+    if x2.shape[0] >= PARALLEL_MIN_GRID:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            fut_exc = executor.submit(gaussian_psf, x2, w_exc)
+            fut_sted = executor.submit(laguerre_gaussian_donut, x2, w_sted)
+            exc_psf, sted_donut = fut_exc.result(), fut_sted.result()
+    else:
+        exc_psf = gaussian_psf(x2, w_exc)
+        sted_donut = laguerre_gaussian_donut(x2, w_sted)
+
+    eff_psf = effective_psf(exc_psf, sted_donut, I_s, I0_sted)
+    sted_donut *= np.e  # Donut peak is 1/e (m = 1)
+    return exc_psf, sted_donut, eff_psf
+
+def compute_all_psfs_gpu(x2, w_exc, w_sted, I_s, I0_sted):
+    """
+    Function that computes the same normalized PSFs as compute_all_psfs() 
+    on the GPU with CuPy.
+
+    The three PSFs are written by a single element-wise CUDA kernel, i.e. in 
+    one pass over GPU memory. Only the 1D factors are transferred to the GPU.
+
+    Input parameters:
+        Same as compute_all_psfs(), x2 may be a NumPy or a CuPy float32 array.
+
+    Output:
+        Tuple of three 2D CuPy float32 arrays (exc_psf, sted_donut, eff_psf), 
+        each normalized to a peak value of 1. Use .get() to copy them to the 
+        host.
+    """
+    x2 = cp.asarray(x2, dtype=cp.float32)
+    g_exc = cp.exp(-x2 * cp.float32(1.0 / (w_exc * w_exc)))
+    s2 = x2 * cp.float32(1.0 / (w_sted * w_sted))
+    g_sted = cp.exp(-s2)
+
+    exc_psf, sted_donut, eff_psf = _psf_gpu_kernel(
+        g_exc[:, None], g_exc[None, :], s2[:, None], s2[None, :], 
+        g_sted[:, None], g_sted[None, :], cp.float32(-I0_sted / I_s))
+    return exc_psf, sted_donut, eff_psf
+
+if cp is not None:
+    # Separable factors are passed as (N, 1) and (1, N) arrays and broadcast 
+    # by CuPy; the donut is normalized by its analytical peak 1/e (m = 1)
+    _psf_gpu_kernel = cp.ElementwiseKernel(
+        "float32 gex, float32 gey, float32 s2x, float32 s2y, "
+        "float32 gsx, float32 gsy, float32 k",
+        "float32 e, float32 d, float32 f",
+        """
+        e = gex * gey;
+        float donut = (s2x + s2y) * (gsx * gsy);
+        d = donut * 2.718281828f;
+        f = e * expf(k * donut);
+        """,
+        "psf_gpu_kernel")
+
+def build_psfs(lambda_exc, lambda_sted, NA, I_s, I0_sted, grid_size, extent_nm, 
+               use_gpu=False):
+    """
+    Function that builds the simulation grid and the normalized excitation, 
+    STED donut and effective PSFs from the configuration parameters.
+
+    The PSFs are not cached on disk: at grid_size = 1000 the fused kernel 
+    takes about as long as reading the three arrays back from a cache would.
+
+    Input parameters:
+        lambda_exc : float
+            Excitation wavelength (nm).
+        lambda_sted : float
+            STED wavelength (nm).
+        NA : float
+            Numerical aperture.
+        I_s : float
+            Saturation intensity (normalized).
+        I0_sted : float
+            Peak STED intensity (normalized).
+        grid_size : int
+            Number of grid points per axis.
+        extent_nm : float
+            Physical extent of the field (nm).
+        use_gpu : bool, optional
+            Compute the PSFs on the GPU with CuPy (default is False). Ignored 
+            when CuPy is not installed.
+
+    Output:
+        Tuple of three 2D NumPy float32 arrays (exc_psf, sted_donut, eff_psf), 
+        each normalized to a peak value of 1.
+    """
+    # Single precision is plenty for an 8-bit image output and halves the 
+    # memory traffic of the PSF computation
+    xy = np.linspace(-extent_nm/2, extent_nm/2, grid_size, dtype=np.float32)
+    x2 = xy * xy  # Squared coordinates, r^2 is broadcast from these
+
+    w_exc = diffraction_limit(lambda_exc, NA)
+    w_sted = diffraction_limit(lambda_sted, NA)
+
+    if use_gpu and cp is not None:
+        psfs = compute_all_psfs_gpu(x2, w_exc, w_sted, I_s, I0_sted)
+        return tuple(psf.get() for psf in psfs)  # Back to host memory
+
+    compute = compute_all_psfs if HAVE_NUMBA else compute_all_psfs_numpy
+    return compute(x2, np.float32(w_exc), np.float32(w_sted), 
+                   np.float32(I_s), np.float32(I0_sted))
@@ -1,26 +1,54 @@
 import numpy as np 
+
+try:
+    from numba import njit
+except ImportError:
+    # Plain Python fallback, _half_max_width() only scans a single 1D profile
+    def njit(*args, **kwargs):
+        return lambda func: func
+
 # ------------------------
 # FULL WIDTH AT HALF MAXIMUM
 # ------------------------
-def fwhm(psf):
+@njit(cache=True)
+def _half_max_width(profile):
+    """
+    Function that returns the distance (in samples) between the first and 
+    last points of a 1D profile that reach half of its maximum.
+
+    The profile is scanned inwards from both ends, so no mask or index 
+    arrays are allocated.
+    """
+    half_max = profile.max() * 0.5
+    first = 0
+    while profile[first] < half_max:
+        first += 1
+    last = profile.shape[0] - 1
+    while profile[last] < half_max:
+        last -= 1
+    return last - first
+
+def fwhm(psf, pixel_size=1.0):
     """
     Function that calculates the FWHM of a Point Spread Function (PSF).
 
+    The PSFs in this simulation are centered and radially symmetric, so the 
+    FWHM is measured on the central row only instead of the whole 2D array.
+
     Input parameters:
         psf : 2D NumPy array
             The PSF intensity distribution.
+        pixel_size : float, optional
+            Grid spacing, extent_nm / (grid_size - 1) to get the FWHM in nm 
+            (default is 1.0, i.e. the FWHM in pixels).
 
     Output:
         float
-        FWHM along one axis (in pixels or spatial units, depending on the grid).
+        FWHM along one axis (in pixels or spatial units, depending on pixel_size).
 
     """    
-    psf_max = np.max(psf)
-    half_max = psf_max / 2
-    # Find where the PSF drops to half-max
-    indices = np.where(psf >= half_max)
-    fwhm = np.max(indices[0]) - np.min(indices[0])  # FWHM along one axis
-    return fwhm
+    profile = psf[psf.shape[0] // 2]  # Central row through the peak
+    return _half_max_width(profile) * pixel_size
 
 # ------------------------
 # DIFFRACTION-LIMITED RESOLUTION (using wavelength)
@@ -1,7 +1,11 @@
 import configparser
+import functools
 import os
 
-def read_config_file():
+# Default configuration file, read when no other path is given
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), 'config.txt')
+
+def read_config_file(path=None):
     """
     Reads the configuration file using configparser and returns a 
     dictionary of parameters if they are within defined limits.
@@ -13,21 +17,51 @@ def read_config_file():
     - I0_sted: STED beam peak intensity (normalized) (0–100)
     - grid_size: Simulation grid resolution (256–1000)
     - extent_nm: Physical extent of the field in nm (500–2000)
+    - use_gpu: Compute the PSFs on the GPU with CuPy (optional, default false)
+
+    The file is parsed only once per process and path; every call returns 
+    its own copy of the parameters, so callers may modify it. A file that 
+    could not be read is not cached and is read again on the next call.
+
+    Input parameters:
+        path : str, optional
+            Path of the configuration file (default is CONFIG_PATH).
+
+    Output:
+        Dictionary of parameters, or None if the file could not be read.
+    """
+    params = _parse_config_file(path or CONFIG_PATH)
+    if params is None:
+        _parse_config_file.cache_clear()  # Do not cache a failed read
+        return None
+    return dict(params)
+
+@functools.lru_cache(maxsize=4)
+def _parse_config_file(path):
+    """
+    Function that parses and validates the configuration file at path. Cached 
+    by read_config_file(), which hands out copies of the result.
     """
     # Initialize configparser and read the file
     config = configparser.ConfigParser()
-    config.read(os.path.join(os.path.dirname(__file__), 'config.txt'))
+    config.read(path)
     # Extract the parameters from the config file
     params = {}
     try:
-        params["lambda_exc"] = float(config.get('settings', 'lambda_exc'))
-        params["lambda_sted"] = float(config.get('settings', 'lambda_sted'))
-        params["NA"] = float(config.get('settings', 'NA'))
-        params["I_s"] = float(config.get('settings', 'I_s'))
-        params["I0_sted"] = float(config.get('settings', 'I0_sted'))
-        params["grid_size"] = int(config.get('settings', 'grid_size'))
-        params["extent_nm"] = int(config.get('settings', 'extent_nm'))
-    except (configparser.NoOptionError, ValueError) as e:
+        # Read the section once (configparser lower-cases the option names)
+        raw = dict(config.items('settings'))
+        params["lambda_exc"] = float(raw['lambda_exc'])
+        params["lambda_sted"] = float(raw['lambda_sted'])
+        params["NA"] = float(raw['na'])
+        params["I_s"] = float(raw['i_s'])
+        params["I0_sted"] = float(raw['i0_sted'])
+        params["grid_size"] = int(raw['grid_size'])
+        params["extent_nm"] = int(raw['extent_nm'])
+        use_gpu = raw.get('use_gpu', 'false').lower()
+        if use_gpu not in config.BOOLEAN_STATES:
+            raise ValueError(f"Not a boolean: use_gpu = {use_gpu}")
+        params["use_gpu"] = config.BOOLEAN_STATES[use_gpu]
+    except (configparser.NoSectionError, KeyError, ValueError) as e:
         print(f"Error reading configuration: {e}")
         return None
 
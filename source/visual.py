@@ -1,6 +1,26 @@
 import matplotlib.pyplot as plt
+from matplotlib.image import imsave
+import numpy as np
 import os
 
+def to_uint8(psf):
+    """
+    Function that quantizes a PSF with peak value 1 to 8-bit grey levels 
+    (0–255), the precision of the saved PNG images. Values outside [0, 1] 
+    are clipped to 0 or 255.
+
+    Input parameters:
+        psf : numpy.ndarray
+            PSF intensity distribution normalized to a peak of 1.
+
+    Output:
+        numpy.ndarray of dtype uint8 with the same shape as psf.
+    """
+    # + 0.5 rounds to nearest; clipping saturates values slightly outside 
+    # [0, 1] (float32 rounding around the analytical peak) instead of 
+    # letting them wrap around modulo 256
+    return np.clip(psf * 255 + 0.5, 0, 255).astype(np.uint8)
+
 def plot_results(exc_psf, sted_donut, eff_psf, lambda_exc, lambda_sted, fwhm_exc, fwhm_eff, extent_nm):
     """
     Function that generates and displays plots for the PSFs (Excitation, 
@@ -26,39 +46,58 @@ def plot_results(exc_psf, sted_donut, eff_psf, lambda_exc, lambda_sted, fwhm_exc
             The extent of the grid in nm (used for axis scaling of the plots).
 
     Output:
+        - Saves each PSF at its native grid resolution as its own image 
+          (exc_psf.png, sted_donut.png, eff_psf.png).
         - Displays multiple plots:
           1. Three subplots showing the Excitation PSF, STED Donut Beam, 
               and Effective PSF.
           2. A plot comparing the FWHM values of the classic confocal 
              method vs. STED.
     """
+    output_dir = os.path.join(os.path.dirname(__file__), "Output")
+    os.makedirs(output_dir, exist_ok=True)  # Safe in case main didn't run
+
+    # Quantize once, so matplotlib only maps 8-bit values to colors instead 
+    # of normalizing and converting the float arrays itself
+    exc_u8 = to_uint8(exc_psf)
+    sted_u8 = to_uint8(sted_donut)
+    eff_u8 = to_uint8(eff_psf)
+
+    # Save the full-resolution PSFs directly (one pixel per grid point),
+    # skipping the Figure/Axes rendering machinery
+    imsave(os.path.join(output_dir, "exc_psf.png"), exc_u8, 
+           cmap='viridis', vmin=0, vmax=255)
+    imsave(os.path.join(output_dir, "sted_donut.png"), sted_u8, 
+           cmap='inferno', vmin=0, vmax=255)
+    imsave(os.path.join(output_dir, "eff_psf.png"), eff_u8, 
+           cmap='viridis', vmin=0, vmax=255)
+
     # Plot the PSFs
     fig, axes = plt.subplots(1, 3, figsize=(12, 3)) # defining subplot
     extent = [-extent_nm / 2, extent_nm / 2, -extent_nm / 2, extent_nm / 2]
     
-    output_dir = os.path.join(os.path.dirname(__file__), "Output")
-    os.makedirs(output_dir, exist_ok=True)  # Safe in case main didn't run
-    
     # Plot Excitation PSF
-    axes[0].imshow(exc_psf, extent=extent, cmap='viridis')
+    axes[0].imshow(exc_u8, extent=extent, cmap='viridis', vmin=0, vmax=255)
     axes[0].set_title(f"Excitation PSF ({lambda_exc} nm)")
     axes[0].set_xlabel("nm")
     axes[0].set_ylabel("nm")
 
     # Plot STED Donut Beam
-    axes[1].imshow(sted_donut, extent=extent, cmap='inferno')
+    axes[1].imshow(sted_u8, extent=extent, cmap='inferno', vmin=0, vmax=255)
     axes[1].set_title(f"STED Donut Beam ({lambda_sted} nm)")
     axes[1].set_xlabel("nm")
     axes[1].set_ylabel("nm")
 
     # Plot Effective PSF (STED Applied)
-    axes[2].imshow(eff_psf, extent=extent, cmap='viridis')
+    axes[2].imshow(eff_u8, extent=extent, cmap='viridis', vmin=0, vmax=255)
     axes[2].set_title("Effective PSF (STED Applied)")
     axes[2].set_xlabel("nm")
     axes[2].set_ylabel("nm")
 
     plt.tight_layout()
-    plt.savefig(os.path.join(output_dir, "PSF_comparison.png"), dpi=300)
+    # The full-resolution PSFs are saved above, so the overview figure does 
+    # not need to upsample them at 300 dpi
+    plt.savefig(os.path.join(output_dir, "PSF_comparison.png"), dpi=100)
     plt.close()
 
     # Plot FWHM comparison
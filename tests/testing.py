@@ -1,9 +1,13 @@
 from start import read_config_file
+from types import SimpleNamespace
 import numpy as np
 import pytest
 from start import validate_parameters
+import psf_functions
 from psf_functions import gaussian_psf, laguerre_gaussian_donut, effective_psf
+from psf_functions import compute_all_psfs, compute_all_psfs_numpy, build_psfs
 from resolution_functions import fwhm, diffraction_limit
+from visual import to_uint8
 
 
 
@@ -19,6 +23,7 @@ def test_read_config_file__types():
     # I0_sted: STED beam peak intensity (normalized) (0–100)
     # grid_size: Simulation grid resolution (256–1000)
     # extent_nm: Physical extent of the field in nm (500–2000)
+    # use_gpu: Compute the PSFs on the GPU with CuPy (true/false)
     """
 
     params = read_config_file()
@@ -32,6 +37,43 @@ def test_read_config_file__types():
     assert isinstance(params["I0_sted"], float), "I0_sted should be float"
     assert isinstance(params["grid_size"], int), "grid_size should be int"
     assert isinstance(params["extent_nm"], int), "extent_nm should be int"
+    assert isinstance(params["use_gpu"], bool), "use_gpu should be bool"
+
+def test_read_config_file__copy():
+    """
+    Test that every call to read_config_file() returns its own copy of the cached parameters.
+    """
+    params = read_config_file()
+    params["grid_size"] = -1
+    assert read_config_file()["grid_size"] != -1, "Cached parameters were modified by a caller"
+
+# Settings section of a valid configuration file, without the optional use_gpu
+CONFIG_SETTINGS = """[settings]
+lambda_exc = 488
+lambda_sted = 750
+NA = 1.4
+I_s = 2
+I0_sted = 25.0
+grid_size = 500
+extent_nm = 1000
+"""
+
+def test_read_config_file__use_gpu_missing(tmp_path):
+    """
+    Test that a missing use_gpu option defaults to False.
+    """
+    path = tmp_path / "config.txt"
+    path.write_text(CONFIG_SETTINGS)
+    assert read_config_file(str(path))["use_gpu"] is False, "use_gpu should default to False"
+
+def test_read_config_file__use_gpu_invalid(tmp_path, capsys):
+    """
+    Test that an invalid use_gpu value makes read_config_file() print an error and return None.
+    """
+    path = tmp_path / "config.txt"
+    path.write_text(CONFIG_SETTINGS + "use_gpu = maybe\n")
+    assert read_config_file(str(path)) is None, "Invalid use_gpu should return None"
+    assert "Error reading configuration: Not a boolean: use_gpu = maybe" in capsys.readouterr().out
 #-----------------------------------------------------------------------------
 # TESTING INVALID PARAMETERS
 #-----------------------------------------------------------------------------
@@ -128,42 +170,46 @@ def test_invalid_extent_nm():
 #-----------------------------------------------------------------------------
 # TESTING PSF AND RESOLUTION FUNCTIONS
 #-----------------------------------------------------------------------------
-def test_psf_functions_types():
+@pytest.fixture(scope="session")
+def psfs():
     """
-    Test whether the PSF functions return arrays with correct shape and type.
+    PSFs built once per test session from the config parameters, on the smallest valid grid
+    (256 x 256) so that the tests stay fast whatever grid_size is set in config.txt.
     """
-    # Simulation parameters from config
-    params = read_config_file()
+    params = {**read_config_file(), "grid_size": 256}
     N = params["grid_size"]
     extent = params["extent_nm"]
-    lambda_exc = params["lambda_exc"]
-    lambda_sted = params["lambda_sted"]
-    NA = params["NA"]
-    I_s = params["I_s"]
-    I0_sted = params["I0_sted"]
 
     # Generate simulation grid
     xy = np.linspace(-extent/2, extent/2, N)
-    x, y = np.meshgrid(xy, xy)
+    x2 = xy * xy
 
     # Compute beam waists
-    w_exc = diffraction_limit(lambda_exc, NA)
-    w_sted = diffraction_limit(lambda_sted, NA)
+    w_exc = diffraction_limit(params["lambda_exc"], params["NA"])
+    w_sted = diffraction_limit(params["lambda_sted"], params["NA"])
 
     # Run PSF calculations
-    exc_psf = gaussian_psf(x, y, w_exc)
-    sted_psf = laguerre_gaussian_donut(x, y, w_sted)
-    eff_psf = effective_psf(exc_psf, sted_psf, I_s, I0_sted)
+    exc_psf = gaussian_psf(x2, w_exc)
+    sted_psf = laguerre_gaussian_donut(x2, w_sted)
+    eff_psf = effective_psf(exc_psf, sted_psf, params["I_s"], params["I0_sted"])
+
+    return SimpleNamespace(params=params, N=N, exc=exc_psf, sted=sted_psf, eff=eff_psf)
+
+def test_psf_functions_types(psfs):
+    """
+    Test whether the PSF functions return arrays with correct shape and type.
+    """
+    N = psfs.N
 
     # Testing types
-    assert isinstance(exc_psf, np.ndarray), "Excitation PSF must be a NumPy array"
-    assert isinstance(sted_psf, np.ndarray), "STED PSF must be a NumPy array"
-    assert isinstance(eff_psf, np.ndarray), "Effective PSF must be a NumPy array"
+    assert isinstance(psfs.exc, np.ndarray), "Excitation PSF must be a NumPy array"
+    assert isinstance(psfs.sted, np.ndarray), "STED PSF must be a NumPy array"
+    assert isinstance(psfs.eff, np.ndarray), "Effective PSF must be a NumPy array"
 
     # Testing shapes
-    assert exc_psf.shape == (N, N), f"Expected shape {(N, N)}, got {exc_psf.shape}"
-    assert sted_psf.shape == (N, N), f"Expected shape {(N, N)}, got {sted_psf.shape}"
-    assert eff_psf.shape == (N, N), f"Expected shape {(N, N)}, got {eff_psf.shape}"
+    assert psfs.exc.shape == (N, N), f"Expected shape {(N, N)}, got {psfs.exc.shape}"
+    assert psfs.sted.shape == (N, N), f"Expected shape {(N, N)}, got {psfs.sted.shape}"
+    assert psfs.eff.shape == (N, N), f"Expected shape {(N, N)}, got {psfs.eff.shape}"
     
     
 def test_diffraction_limit_return():
@@ -179,26 +225,14 @@ def test_diffraction_limit_return():
     assert result > 0, "diffraction_limit should return a positive value"
 
 
-def test_fwhm_return():
+def test_fwhm_return(psfs):
     """
     Tests whether fwhm() returns a float and behaves reasonably on a Gaussian PSF.
     """
-    params = read_config_file()
-    N = params["grid_size"]
-    extent = params["extent_nm"]
-    lambda_exc = params["lambda_exc"]
-    NA = params["NA"]
-
-    # Create 2D Gaussian PSF
-    xy = np.linspace(-extent/2, extent/2, N)
-    x, y = np.meshgrid(xy, xy)
-    w_exc = diffraction_limit(lambda_exc, NA)
-    psf = gaussian_psf(x, y, w_exc)
-
-    result = fwhm(psf)
+    result = fwhm(psfs.exc)
     assert isinstance(result, (int, float, np.integer, np.floating)), "FWHM must be a number"
     assert result > 0, "FWHM must be positive"
-    assert result < N, "FWHM should be smaller than grid size"
+    assert result < psfs.N, "FWHM should be smaller than grid size"
     
 def test_gaussian_psf_peak_and_symmetry():
     """ 
@@ -207,8 +241,8 @@ def test_gaussian_psf_peak_and_symmetry():
     """    
     w0 = 100  # Beam waist in [nm]
     xy = np.linspace(-500, 500, 1001)
-    x, y = np.meshgrid(xy, xy)
-    psf = gaussian_psf(x, y, w0)
+    x2 = xy * xy
+    psf = gaussian_psf(x2, w0)
 
     center_idx = len(xy) // 2
     center = psf[center_idx, center_idx]
@@ -239,8 +273,8 @@ def test_laguerre_psf_peak():
     """
     w = 100  # Beam waist in [nm]
     xy = np.linspace(-500, 500, 1001)
-    x, y = np.meshgrid(xy, xy)
-    psf = laguerre_gaussian_donut(x, y, w)
+    x2 = xy * xy
+    psf = laguerre_gaussian_donut(x2, w)
 
     center = psf[500, 500]
     ring = psf[500, 400] #Has to be more than 0
@@ -249,6 +283,8 @@ def test_laguerre_psf_peak():
     assert np.isclose(center,0, atol=1e-6), "Peak should be 0 at the center"
     #Check that we have a ring with onzero intensity
     assert ring>0
+    #Check that the ring peaks at the analytical value (m/e)^m = 1/e for m=1
+    assert np.isclose(psf.max(), 1/np.e, atol=1e-3), "Donut peak should be 1/e"
     
 def test_gaussian_psf_mathematical_behaviour():
     """ 
@@ -259,11 +295,10 @@ def test_gaussian_psf_mathematical_behaviour():
     """
     w0 = 100  # Beam waist in [nm]
     #Creating a small grid centered around (0,0) going up to r=w0.
-    x = np.array([[-w0,0,w0]])
-    y = np.array([[0,0,0]])
-    psf = gaussian_psf(x, y, w0)
-    center_val = psf[0, 1]  # intensity at x=0
-    edge_val = psf[0, 0]    # intensity at x=-w0
+    xy = np.array([-w0,0,w0])
+    psf = gaussian_psf(xy * xy, w0)
+    center_val = psf[1, 1]  # intensity at x=0
+    edge_val = psf[1, 0]    # intensity at x=-w0
 
     assert np.isclose(center_val,1.0,atol=1e-6), "Center should be 1"
     assert np.isclose(edge_val, 1/np.e, atol=1e-3), "At r=w0, intensity shoud be close to 1/e"
@@ -275,10 +310,10 @@ def test_effective_psf():
     """
     w0 = 100  # Beam waist in [nm]
     xy = np.linspace(-500, 500, 1001)
-    x, y = np.meshgrid(xy, xy)
+    x2 = xy * xy
     
-    exc_psf = gaussian_psf(x, y, w0)
-    sted_psf = laguerre_gaussian_donut(x, y, w0)
+    exc_psf = gaussian_psf(x2, w0)
+    sted_psf = laguerre_gaussian_donut(x2, w0)
     eff_psf = effective_psf(exc_psf, sted_psf, I_s=1.0, I0_sted=50)
     
     center = (500, 500)
@@ -290,3 +325,142 @@ def test_effective_psf():
     assert eff_psf[ring] < exc_psf[ring],\
         "Outer region of effective PSF should be suppressed with high STED intensity"
 
+def test_compute_all_psfs_matches_reference():
+    """ 
+    Test for checking that the separable PSF functions and the fused PSF kernel give the same 
+    excitation, STED and effective PSFs as the direct evaluation of the formulas on a 2D grid.
+    """
+    w_exc, w_sted = 100, 150  # Beam waists in [nm]
+    xy = np.linspace(-500, 500, 301)
+    x2 = xy * xy
+
+    # Direct (non-separable) evaluation of the PSF formulas as reference, on an open grid:
+    # x is (N, 1) and y is (1, N), so only r2 is allocated at full N x N size
+    x, y = np.ogrid[-500:500:301j, -500:500:301j]
+    r2 = x**2 + y**2
+    exc_ref = np.exp(-r2 / w_exc**2)
+    sted_ref = (r2 / w_sted**2) * np.exp(-r2 / w_sted**2)
+    eff_ref = effective_psf(exc_ref, sted_ref, I_s=2.0, I0_sted=25.0)
+
+    assert np.allclose(gaussian_psf(x2, w_exc), exc_ref, atol=1e-6), \
+        "gaussian_psf differs from the direct Gaussian formula"
+    assert np.allclose(laguerre_gaussian_donut(x2, w_sted), sted_ref, atol=1e-6), \
+        "laguerre_gaussian_donut differs from the direct donut formula"
+
+    # The fused kernel normalizes the donut by its analytical peak 1/e
+    sted_ref *= np.e
+
+    exc_psf, sted_psf, eff_psf = compute_all_psfs(x2, w_exc, w_sted, 2.0, 25.0)
+
+    assert np.allclose(exc_psf, exc_ref, atol=1e-6), "Excitation PSF differs from gaussian_psf"
+    assert np.allclose(sted_psf, sted_ref, atol=1e-6), "STED PSF differs from laguerre_gaussian_donut"
+    assert np.allclose(eff_psf, eff_ref, atol=1e-6), "Effective PSF differs from effective_psf"
+
+    # Single precision grid as used by main.py
+    x2_32 = x2.astype(np.float32)
+    psfs_32 = compute_all_psfs(x2_32, np.float32(w_exc), np.float32(w_sted),
+                               np.float32(2.0), np.float32(25.0))
+    for psf_32, ref in zip(psfs_32, (exc_ref, sted_ref, eff_ref)):
+        assert psf_32.dtype == np.float32, "float32 grid should give float32 PSFs"
+        assert np.allclose(psf_32, ref, atol=1e-5), "float32 PSF differs from reference"
+
+def test_compute_all_psfs_numpy_fallback():
+    """ 
+    Test for checking that the NumPy fallback (used without Numba) gives the same normalized PSFs 
+    as the fused kernel, both below and above the grid size where it switches to threads.
+    """
+    for N in (301, 601):
+        xy = np.linspace(-500, 500, N, dtype=np.float32)
+        x2 = xy * xy
+        args = (x2, np.float32(100), np.float32(150), np.float32(2.0), np.float32(25.0))
+
+        for fallback, fused in zip(compute_all_psfs_numpy(*args), compute_all_psfs(*args)):
+            assert fallback.dtype == np.float32, "Fallback should keep the grid precision"
+            assert np.allclose(fallback, fused, atol=1e-5), "Fallback differs from fused kernel"
+
+def test_numexpr_matches_numpy(monkeypatch):
+    """ 
+    Test for checking that laguerre_gaussian_donut() and effective_psf() give the same result 
+    with numexpr as with plain NumPy, including a non-integer mode index m.
+    """
+    pytest.importorskip("numexpr")
+    xy = np.linspace(-500, 500, 201, dtype=np.float32)
+    x2 = xy * xy
+    exc = gaussian_psf(x2, 100)
+
+    with_ne = [laguerre_gaussian_donut(x2, 150, m) for m in (1, 1.5)]
+    with_ne.append(effective_psf(exc, with_ne[0], 2.0, 25.0))
+
+    monkeypatch.setattr(psf_functions, "ne", None)
+    without_ne = [laguerre_gaussian_donut(x2, 150, m) for m in (1, 1.5)]
+    without_ne.append(effective_psf(exc, without_ne[0], 2.0, 25.0))
+
+    for a, b in zip(with_ne, without_ne):
+        assert np.allclose(a, b, atol=1e-6), "numexpr and NumPy branches differ"
+
+def test_build_psfs():
+    """ 
+    Test for checking that build_psfs() returns three float32 grid_size x grid_size PSFs that 
+    match the fused kernel evaluated on the same grid.
+    """
+    N, extent_nm = 301, 2000
+    psfs = build_psfs(488, 592, 1.4, 2.0, 25.0, N, extent_nm)
+
+    xy = np.linspace(-extent_nm/2, extent_nm/2, N, dtype=np.float32)
+    x2 = xy * xy
+    expected = compute_all_psfs(x2, np.float32(diffraction_limit(488, 1.4)), 
+                                np.float32(diffraction_limit(592, 1.4)), 
+                                np.float32(2.0), np.float32(25.0))
+
+    assert len(psfs) == 3, "build_psfs should return three PSFs"
+    for psf, ref in zip(psfs, expected):
+        assert psf.shape == (N, N), "PSF shape should be (grid_size, grid_size)"
+        assert psf.dtype == np.float32, "PSFs should be single precision"
+        assert np.allclose(psf, ref, atol=1e-6), "build_psfs differs from the fused kernel"
+
+def test_compute_all_psfs_gpu():
+    """ 
+    Test for checking that the CuPy GPU kernel gives the same normalized PSFs as the fused CPU 
+    kernel (skipped when CuPy is not installed).
+    """
+    pytest.importorskip("cupy")
+    from psf_functions import compute_all_psfs_gpu
+
+    xy = np.linspace(-500, 500, 301, dtype=np.float32)
+    x2 = xy * xy
+    args = (x2, np.float32(100), np.float32(150), np.float32(2.0), np.float32(25.0))
+
+    for gpu, cpu in zip(compute_all_psfs_gpu(*args), compute_all_psfs(*args)):
+        assert np.allclose(gpu.get(), cpu, atol=1e-5), "GPU PSF differs from fused kernel"
+
+def test_fwhm_gaussian_in_nm():
+    """ 
+    Test for checking that fwhm() converts to nm with the grid spacing and matches the 
+    analytical FWHM of a Gaussian PSF, 2 * w0 * sqrt(ln 2).
+    """
+    w0 = 100  # Beam waist in [nm]
+    xy = np.linspace(-500, 500, 1001)
+    x2 = xy * xy
+    psf = gaussian_psf(x2, w0)
+
+    pixel_size = 1000 / (len(xy) - 1)
+    expected = 2 * w0 * np.sqrt(np.log(2))
+    # Sampling limits the accuracy to about one pixel
+    assert np.isclose(fwhm(psf, pixel_size), expected, atol=2 * pixel_size), \
+        "FWHM in nm should match 2 * w0 * sqrt(ln 2)"
+
+def test_to_uint8():
+    """ 
+    Test for checking that to_uint8() maps a PSF with peak 1 onto the full 8-bit range, rounding 
+    to the nearest grey level and saturating values outside [0, 1] instead of wrapping around.
+    """
+    psf = np.array([[0.0, 0.5], [0.999, 1.0]], dtype=np.float32)
+    result = to_uint8(psf)
+
+    assert result.dtype == np.uint8, "Quantized PSF must be uint8"
+    assert np.array_equal(result, [[0, 128], [255, 255]]), "Unexpected grey levels"
+
+    # Slightly out of range values, e.g. float32 rounding around the analytical peak
+    over_range = np.array([1.0000001, 1.01, 2.0, -0.01], dtype=np.float32)
+    assert np.array_equal(to_uint8(over_range), [255, 255, 255, 0]), \
+        "Out of range values should saturate at 0 and 255"